@@ -0,0 +1,14 @@
+"""
+Gunicorn settings for the Image Sharing Hotspot
+Run: gunicorn -c gunicorn_conf.py main:app
+"""
+
+bind = '0.0.0.0:5000'
+worker_class = 'gthread'
+workers = 2  # Pi has few cores; threads cover slow uploads
+threads = 4
+keepalive = 5
+sendfile = True  # send_from_directory goes out via sendfile(2)
+
+# Not preloaded: each worker imports main.py and starts its own log writer thread
+preload_app = False
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Hotspot control daemon for the Image Sharing Hotspot
+Keeps the kick logic of manage-hotspot-users.sh resident behind a unix
+socket so the Flask app does not fork a shell per request. Connection counts
+need no root and are read by main.py straight from /proc/net/arp.
+
+Protocol: one command per line, one reply line per command
+    kick <ip>  -> ok | error
+"""
+
+import grp
+import ipaddress
+import os
+import socketserver
+import subprocess
+import threading
+from datetime import datetime
+
+SOCKET_PATH = '/run/hotspot-ctl.sock'
+SOCKET_GROUP = os.environ.get('HOTSPOT_CTL_GROUP', 'pi')  # Group the Flask app runs as
+LOGFILE = '/var/log/image-hotspot/connections.log'
+HOTSPOT_GATEWAY = ipaddress.ip_address('192.168.0.1')  # HOTSPOT_IP in simple_hotspot.sh
+KICK_SECONDS = 30  # Rules are removed after this to allow reconnection
+
+def _iptables(action, ip):
+    """Add (-A) or delete (-D) the DROP rules for an IP"""
+    subprocess.run(['iptables', action, 'INPUT', '-s', ip, '-j', 'DROP'], check=True)
+    subprocess.run(['iptables', action, 'OUTPUT', '-d', ip, '-j', 'DROP'], check=True)
+
+def kick(ip):
+    """Disconnect an IP, same rules as `manage-hotspot-users.sh kick`"""
+    addr = ipaddress.ip_address(ip)
+    # Dropping loopback or the Pi's own address would cut nginx/gunicorn off
+    if addr.is_loopback or addr.is_unspecified or addr == HOTSPOT_GATEWAY:
+        raise ValueError(f"refusing to kick {addr}")
+    ip = str(addr)
+    _iptables('-A', ip)
+    with open(LOGFILE, 'a') as f:
+        f.write(f"{datetime.now().ctime()}: Disconnected {ip}\n")
+
+    timer = threading.Timer(KICK_SECONDS, _iptables, args=('-D', ip))
+    timer.daemon = True
+    timer.start()
+
+def dispatch(line):
+    """Run one protocol line and return the reply"""
+    command, _, arg = line.strip().partition(' ')
+    try:
+        if command == 'kick' and arg:
+            kick(arg)
+            return 'ok'
+    except (ValueError, OSError, subprocess.CalledProcessError):
+        pass
+    return 'error'
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    """Serve commands for as long as the client keeps the connection open"""
+
+    def handle(self):
+        for line in self.rfile:
+            reply = dispatch(line.decode('utf-8', 'replace'))
+            self.wfile.write(reply.encode() + b'\n')
+
+class ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def main():
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+    os.makedirs(os.path.dirname(LOGFILE), exist_ok=True)
+
+    # Create the socket without any "other" access, then hand it to the app's group
+    old_umask = os.umask(0o117)
+    try:
+        server = ControlServer(SOCKET_PATH, ControlHandler)
+    finally:
+        os.umask(old_umask)
+
+    with server:
+        os.chown(SOCKET_PATH, -1, grp.getgrnam(SOCKET_GROUP).gr_gid)
+        os.chmod(SOCKET_PATH, 0o660)
+        print(f"hotspot-ctl listening on {SOCKET_PATH}")
+        server.serve_forever()
+
+if __name__ == '__main__':
+    main()
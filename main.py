@@ -4,40 +4,290 @@ Minimal Flask Integration for Social Event Image Sharing
 Focus: Upload -> Immediate disconnect -> Clean UX
 """
 
-from flask import Flask, request, render_template, redirect, jsonify
+from flask import Flask, request, render_template, stream_template, redirect, jsonify, send_from_directory, abort
 import os
+import sys
+import io
+import heapq
+import importlib.util
+import mimetypes
+import atexit
+import ctypes
+import queue
+import re
+import shutil
+import socket
+import struct
 import subprocess
-import json
+import tempfile
+import threading
+import orjson
 from datetime import datetime
-from werkzeug.utils import secure_filename
+from urllib.parse import quote
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = '/home/pi/event_images'
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+# Behind nginx: internal location aliased to UPLOAD_FOLDER (see nginx-image-hotspot.conf)
+app.config['X_ACCEL_PREFIX'] = os.environ.get('X_ACCEL_PREFIX')
+# Behind Apache mod_xsendfile
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+# Templates don't change at runtime: never stat them for changes, even with DEBUG on
+app.config['TEMPLATES_AUTO_RELOAD'] = False
 
-# Ensure upload directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+COPY_CHUNK_SIZE = 1 << 20  # 1MiB per sendfile/copy call
+EVENT_LOG = '/var/log/image-hotspot/events.log'
+CTL_SOCKET = '/run/hotspot-ctl.sock'  # hotspot-ctl.py daemon
+HOTSPOT_IFACE = 'wlan0'
+HOTSPOT_SSID = os.environ.get('HOTSPOT_SSID')
+HOTSPOT_PASSWORD = os.environ.get('HOTSPOT_PASSWORD')
+
+def init_storage():
+    """Ensure upload and log directories exist"""
+    for path in (app.config['UPLOAD_FOLDER'], os.path.dirname(EVENT_LOG)):
+        try:
+            os.mkdir(path)  # Single syscall in the usual case
+        except FileExistsError:
+            pass
+        except FileNotFoundError:
+            os.makedirs(path, exist_ok=True)
+
+init_storage()
+
+# Event log is opened once as a raw O_APPEND fd: each os.write lands whole at the
+# end of the file, even with several gunicorn workers appending at once.
+# Requests only queue the entry dict; a background thread encodes and writes it
+# so neither serialization nor disk I/O sits on the request path.
+_LOG_FD = os.open(EVENT_LOG, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+_LOG_Q = queue.SimpleQueue()
+_LOG_BATCH = 1 << 16  # Max bytes per os.write
+_LOG_OPTS = orjson.OPT_APPEND_NEWLINE
+
+def _encode_log(entry):
+    """Serialize one entry; anything orjson can't handle is logged as its str()"""
+    try:
+        return orjson.dumps(entry, default=str, option=_LOG_OPTS)
+    except TypeError:  # orjson.JSONEncodeError, e.g. non-str dict keys
+        return orjson.dumps({'unencodable_entry': repr(entry)}, option=_LOG_OPTS)
+
+def _write_log(first):
+    """Encode an entry plus whatever else is already queued and write them in one os.write"""
+    line = _encode_log(first)
+    lines = [line]
+    size = len(line)
+    while size < _LOG_BATCH:
+        try:
+            entry = _LOG_Q.get_nowait()
+        except queue.Empty:
+            break
+        line = _encode_log(entry)
+        lines.append(line)
+        size += len(line)
+    data = memoryview(b''.join(lines))
+    while data:
+        data = data[os.write(_LOG_FD, data):]
+
+def _log_writer():
+    """Drain queued log entries"""
+    while True:
+        try:
+            _write_log(_LOG_Q.get())
+        except OSError as e:
+            # Disk full or similar: drop this batch but keep the writer alive
+            print(f"event log write failed: {e}", file=sys.stderr)
+
+def _flush_log():
+    """Write out anything still queued on interpreter exit"""
+    while True:
+        try:
+            _write_log(_LOG_Q.get_nowait())
+        except queue.Empty:
+            break
+
+threading.Thread(target=_log_writer, name='event-log', daemon=True).start()
+atexit.register(_flush_log)
+
+def _render_wifi_qr():
+    """Encode the WiFi QR once; SSID and password are fixed per deployment"""
+    if not (HOTSPOT_SSID and HOTSPOT_PASSWORD):
+        return None
+    
+    # qr-code.py isn't importable by name, load it from next to this file
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'qr-code.py')
+    spec = importlib.util.spec_from_file_location('qr_code', path)
+    qr_code = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(qr_code)
+    
+    buf = io.BytesIO()
+    qr_code.generate_wifi_qr(HOTSPOT_SSID, HOTSPOT_PASSWORD).save(
+        buf, kind='png', scale=qr_code.WIFI_QR_SCALE, border=qr_code.QR_BORDER)
+    return buf.getvalue()
+
+_WIFI_QR_PNG = _render_wifi_qr()
+
+# Pages with no dynamic data are rendered once
+with app.app_context():
+    _UPLOAD_HTML = render_template('upload.html').encode('utf-8')
+    _DISCONNECTED_HTML = render_template('disconnected.html').encode('utf-8')
+    # Compile the per-request success page now so the first upload doesn't pay for it
+    app.jinja_env.get_template('upload_success.html')
+
+_TRUSTED_PROXIES = frozenset({'127.0.0.1', '::1'})
 
 def get_client_ip():
     """Get real client IP"""
-    if request.headers.getlist("X-Forwarded-For"):
-        return request.headers.getlist("X-Forwarded-For")[0]
-    return request.remote_addr
+    remote = request.remote_addr
+    # Only the local nginx may vouch for a client; the last hop is the one it added
+    if remote in _TRUSTED_PROXIES:
+        xff = request.headers.get("X-Forwarded-For")
+        if xff:
+            return xff.rpartition(',')[2].strip()
+    return remote
+
+# Pre-bound for the per-request logging path
+_now = datetime.now
+_log_put = _LOG_Q.put
 
 def log_event(ip, action, details=None):
-    """Simple event logging"""
-    log_entry = {
-        'timestamp': datetime.now().isoformat(),
+    """Simple event logging; returns as soon as the entry is queued"""
+    _log_put({
+        'timestamp': _now(),  # orjson emits ISO 8601 natively
         'ip': ip,
         'action': action,
         'details': details
-    }
+    })
+
+# Characters that are unsafe in a filename on disk or in an /image/<filename> URL,
+# plus all ASCII control characters
+_UNSAFE_CHARS = '/\\:*?"<>| #%;&+\'`' + ''.join(map(chr, range(32))) + '\x7f'
+_SAFE_TBL = str.maketrans({c: '_' for c in _UNSAFE_CHARS})
+# Camera defaults like IMG_1234.jpg are already safe as-is
+_SAFE_RE = re.compile(r'[A-Za-z0-9_.\-]{1,128}')
+_MAX_NAME_BYTES = 200
+
+def _sanitize(filename):
+    """Make an uploaded filename safe to store, keeping its extension"""
+    if filename.isascii() and _SAFE_RE.fullmatch(filename):
+        return filename
+    name = filename.translate(_SAFE_TBL)
     
-    with open('/var/log/image-hotspot/events.log', 'a') as f:
-        f.write(json.dumps(log_entry) + '\n')
+    # Cap the UTF-8 length (NAME_MAX is 255 bytes, and the timestamp prefix is
+    # added on top) while keeping a short extension intact
+    stem, dot, ext = name.rpartition('.')
+    if not dot or len(ext) > 8:
+        stem, ext = name, ''
+    else:
+        ext = '.' + ext
+    budget = _MAX_NAME_BYTES - len(ext.encode())
+    return stem.encode()[:budget].decode('utf-8', 'ignore') + ext
+
+def _stream_fd(stream):
+    """Return the OS-level fd behind an upload stream, or None if it lives in memory"""
+    if isinstance(stream, tempfile.SpooledTemporaryFile):
+        # fileno() would force an in-memory spool to disk; only use it once rolled over
+        if not stream._rolled:
+            return None
+        stream = stream._file
+    try:
+        return stream.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+# Per-thread copy buffer, reused across uploads
+_copy_local = threading.local()
+
+def _copy_readinto(stream, out_fd):
+    """Copy an in-memory stream through one reused buffer, no per-chunk bytes"""
+    view = getattr(_copy_local, 'view', None)
+    if view is None:
+        view = _copy_local.view = memoryview(bytearray(COPY_CHUNK_SIZE))
+    while True:
+        n = stream.readinto(view)
+        if not n:
+            break
+        chunk = view[:n]
+        while chunk:
+            chunk = chunk[os.write(out_fd, chunk):]
+
+def create_upload(folder, timestamp, seq, name):
+    """Create a new, unused upload file; returns (fd, filename, seq used)"""
+    while True:
+        filename = f"{timestamp}_{seq:03d}_{name}"
+        try:
+            # O_EXCL: another request (thread or worker) may have taken this name
+            fd = os.open(folder + '/' + filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            seq += 1
+            continue
+        return fd, filename, seq
+
+def save_upload(file, out_fd):
+    """Copy an uploaded file into out_fd and close it, in-kernel via sendfile when possible"""
+    stream = file.stream
+    try:
+        in_fd = _stream_fd(stream)
+        if in_fd is not None:
+            stream.flush()
+            offset = stream.tell()
+            while True:
+                sent = os.sendfile(out_fd, in_fd, offset, COPY_CHUNK_SIZE)
+                if sent == 0:
+                    break
+                offset += sent
+        elif hasattr(stream, 'readinto'):
+            _copy_readinto(stream, out_fd)
+        else:
+            with open(out_fd, 'wb', closefd=False) as out:
+                shutil.copyfileobj(stream, out, COPY_CHUNK_SIZE)
+    finally:
+        os.close(out_fd)
+
+# One persistent connection to hotspot-ctl, shared by all request threads
+_ctl_conn = None
+_ctl_lock = threading.Lock()
+
+def _ctl_connect():
+    """Open a connection to the hotspot-ctl daemon"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    try:
+        sock.connect(CTL_SOCKET)
+    except OSError:
+        sock.close()
+        raise
+    return sock, sock.makefile('rb')
+
+def ctl_command(command):
+    """Send one command to hotspot-ctl and return its reply (raises OSError if unreachable)"""
+    global _ctl_conn
+    with _ctl_lock:
+        for attempt in range(2):
+            reused = _ctl_conn is not None
+            if not reused:
+                _ctl_conn = _ctl_connect()
+            sock, reader = _ctl_conn
+            try:
+                sock.sendall(command.encode() + b'\n')
+                reply = reader.readline()
+                if not reply:
+                    raise ConnectionResetError('hotspot-ctl closed the connection')
+                return reply.decode().strip()
+            except OSError:
+                reader.close()
+                sock.close()
+                _ctl_conn = None
+                # A stale connection (daemon restarted) gets one reconnect
+                if not reused or attempt:
+                    raise
 
 def disconnect_user(ip):
     """Disconnect user from hotspot"""
+    try:
+        return ctl_command(f'kick {ip}') == 'ok'
+    except OSError:
+        pass
+
+    # Daemon not running: fall back to the management script
     try:
         subprocess.run([
             '/usr/local/bin/manage-hotspot-users.sh', 
@@ -48,6 +298,150 @@ def disconnect_user(ip):
     except subprocess.CalledProcessError:
         return False
 
+def _count_arp(iface=HOTSPOT_IFACE):
+    """Count neighbour entries on the hotspot interface straight from procfs"""
+    with open('/proc/net/arp', 'rb') as f:
+        data = f.read()
+    suffix = b' ' + iface.encode()
+    return sum(1 for line in data.splitlines()[1:] if line.endswith(suffix))
+
+def count_connections():
+    """Number of devices currently on the hotspot"""
+    try:
+        return _count_arp()
+    except OSError:
+        pass
+
+    # No procfs (not Linux): fall back to the management script's arp -a
+    result = subprocess.run([
+        '/usr/local/bin/manage-hotspot-users.sh', 'count'
+    ], capture_output=True, text=True)
+    
+    return int(result.stdout.strip()) if result.returncode == 0 else 0
+
+# Last four characters of an image name ('jpeg' is the tail of '.jpeg')
+_IMG_EXTS = frozenset({'.png', '.jpg', 'jpeg', '.gif'})
+
+# Sorted image listing, refreshed only when the upload directory's mtime changes
+_GALLERY_CACHE = {'mtime': 0, 'images': [], 'seen': frozenset()}
+
+def _is_image(filename):
+    return filename[-4:].lower() in _IMG_EXTS
+
+# inotify(7) constants
+_IN_CLOEXEC = 0o2000000
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_DELETE = 0x200
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len; name follows
+
+# Listing kept current by the inotify thread; it is the only writer, and it
+# replaces 'images' instead of mutating it so readers can use it lock-free
+_WATCH = {'active': False, 'images': [], 'names': set()}
+
+def _watch_rescan(folder):
+    with os.scandir(folder) as it:
+        names = {entry.name for entry in it if _is_image(entry.name)}
+    _WATCH['names'] = names
+    _WATCH['images'] = sorted(names, reverse=True)  # Newest first
+
+def _watch_add(name):
+    names = _WATCH['names']
+    if name in names:
+        return
+    names.add(name)
+    images = _WATCH['images']
+    if not images or name > images[0]:
+        # New uploads carry the newest timestamp, so they go on the front
+        _WATCH['images'] = [name] + images
+    else:
+        _WATCH['images'] = sorted(names, reverse=True)
+
+def _watch_remove(name):
+    names = _WATCH['names']
+    if name in names:
+        names.discard(name)
+        _WATCH['images'] = [n for n in _WATCH['images'] if n != name]
+
+def _watch_uploads(fd, folder):
+    """Apply inotify events for the upload folder to the in-memory listing"""
+    try:
+        while True:
+            data = os.read(fd, 64 * 1024)
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = _IN_EVENT.unpack_from(data, offset)
+                start = offset + _IN_EVENT.size
+                name = os.fsdecode(data[start:start + length].rstrip(b'\0'))
+                offset = start + length
+                
+                if mask & _IN_Q_OVERFLOW:
+                    _watch_rescan(folder)
+                elif mask & _IN_IGNORED:
+                    return  # Watch is gone (folder removed)
+                elif not _is_image(name):
+                    continue
+                elif mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO):
+                    _watch_add(name)
+                elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                    _watch_remove(name)
+    finally:
+        # However the thread ends, stop serving the (now stale) listing and
+        # let list_images() fall back to the mtime-validated scan
+        _WATCH['active'] = False
+        os.close(fd)
+
+def _start_upload_watch(folder):
+    """Watch the upload folder with inotify; returns False where it isn't available"""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(_IN_CLOEXEC)
+    except (OSError, AttributeError):
+        return False
+    if fd < 0:
+        return False
+    
+    mask = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_DELETE | _IN_MOVED_FROM
+    if libc.inotify_add_watch(fd, os.fsencode(folder), mask) < 0:
+        os.close(fd)
+        return False
+    
+    # Seed only after the watch exists so no upload slips between the two
+    _watch_rescan(folder)
+    _WATCH['active'] = True
+    threading.Thread(target=_watch_uploads, args=(fd, folder), name='upload-watch', daemon=True).start()
+    return True
+
+def list_images():
+    """Uploaded images, newest first"""
+    if _WATCH['active']:
+        return _WATCH['images']
+    
+    folder = app.config['UPLOAD_FOLDER']
+    mtime = os.stat(folder).st_mtime_ns
+    if mtime != _GALLERY_CACHE['mtime']:
+        with os.scandir(folder) as it:
+            names = frozenset(entry.name for entry in it if _is_image(entry.name))
+        seen = _GALLERY_CACHE['seen']
+        if seen <= names:
+            # Only additions (the usual case): merge the few new names into the sorted list
+            added = sorted(names - seen, reverse=True)
+            images = list(heapq.merge(_GALLERY_CACHE['images'], added, reverse=True))
+        else:
+            images = sorted(names, reverse=True)  # Newest first
+        # Replace rather than mutate: a streaming gallery may still be iterating the old list
+        _GALLERY_CACHE.update(mtime=mtime, images=images, seen=names)
+    return _GALLERY_CACHE['images']
+
+def count_images():
+    """Number of uploaded images"""
+    return len(list_images())
+
+_start_upload_watch(app.config['UPLOAD_FOLDER'])
+
 @app.route('/')
 def index():
     """Landing page - redirect to upload"""
@@ -67,15 +461,19 @@ def upload():
         files = request.files.getlist('files[]')
         uploaded_files = []
         
+        # One timestamp per POST; the counter keeps names unique, bumped past any
+        # name another upload in the same second already created
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        folder = app.config['UPLOAD_FOLDER']
+        seq = 0
+        
         for file in files:
             if file and file.filename != '':
-                # Secure filename with timestamp
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                original_name = secure_filename(file.filename)
-                filename = f"{timestamp}_{original_name}"
+                original_name = _sanitize(file.filename)
+                out_fd, _, seq = create_upload(folder, timestamp, seq, original_name)
+                seq += 1
                 
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
+                save_upload(file, out_fd)
                 uploaded_files.append(original_name)
         
         log_event(client_ip, 'uploaded', {'count': len(uploaded_files), 'files': uploaded_files})
@@ -87,7 +485,7 @@ def upload():
                              total_uploaded=len(uploaded_files))
     
     log_event(client_ip, 'viewing_upload_page')
-    return render_template('upload.html')
+    return app.response_class(_UPLOAD_HTML, mimetype='text/html')
 
 @app.route('/disconnect')
 def auto_disconnect():
@@ -96,7 +494,7 @@ def auto_disconnect():
     
     if disconnect_user(client_ip):
         log_event(client_ip, 'disconnected', 'user_requested')
-        return render_template('disconnected.html')
+        return app.response_class(_DISCONNECTED_HTML, mimetype='text/html')
     else:
         return render_template('disconnect_manual.html')
 
@@ -104,35 +502,44 @@ def auto_disconnect():
 def gallery():
     """Optional: View uploaded images (for event host)"""
     try:
-        images = []
-        for filename in os.listdir(app.config['UPLOAD_FOLDER']):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-                images.append(filename)
-        
-        images.sort(reverse=True)  # Newest first
-        return render_template('gallery.html', images=images)
+        # Stream the page so <img> tags go out as they render instead of as one string
+        return app.response_class(stream_template('gallery.html', images=iter(list_images())))
     except Exception as e:
         return f"Error loading gallery: {e}"
 
 @app.route('/image/<filename>')
 def serve_image(filename):
     """Serve uploaded images"""
+    prefix = app.config['X_ACCEL_PREFIX']
+    # Only nginx acts on X-Accel-Redirect; clients hitting gunicorn's :5000
+    # directly still get the file body
+    if prefix and request.remote_addr in _TRUSTED_PROXIES:
+        # Let nginx sendfile() the image; Python only writes the headers
+        if '/' in filename or filename.startswith('.'):
+            abort(404)
+        r = app.response_class()
+        r.headers['X-Accel-Redirect'] = prefix + quote(filename)
+        r.headers['Content-Type'] = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        return r
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
+@app.route('/qr/wifi.png')
+def wifi_qr():
+    """WiFi connection QR, pre-rendered at startup"""
+    if _WIFI_QR_PNG is None:
+        return "WiFi QR not configured (set HOTSPOT_SSID and HOTSPOT_PASSWORD)", 404
+    return app.response_class(_WIFI_QR_PNG, mimetype='image/png',
+                              headers={'Cache-Control': 'public, max-age=86400'})
+
 @app.route('/stats')
 def stats():
     """Simple stats for event host"""
     try:
         # Count files
-        image_count = len([f for f in os.listdir(app.config['UPLOAD_FOLDER']) 
-                          if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))])
+        image_count = count_images()
         
         # Count current connections
-        result = subprocess.run([
-            '/usr/local/bin/manage-hotspot-users.sh', 'count'
-        ], capture_output=True, text=True)
-        
-        current_connections = int(result.stdout.strip()) if result.returncode == 0 else 0
+        current_connections = count_connections()
         
         return jsonify({
             'images_uploaded': image_count,
@@ -143,4 +550,6 @@ def stats():
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
+    if not os.environ.get('DEV'):
+        sys.exit("Run under gunicorn: gunicorn -c gunicorn_conf.py main:app (DEV=1 for the dev server)")
     app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
@@ -4,28 +4,24 @@ QR Code and Flask Integration for Image Sharing Hotspot
 This script helps generate QR codes and manage the Flask app integration
 """
 
-import qrcode
-import json
+import segno
+from segno import helpers
+import orjson
 from io import BytesIO
 import base64
 
+# Module sizes used when writing the PNGs
+WIFI_QR_SCALE = 10
+COMBINED_QR_SCALE = 8
+QR_BORDER = 4
+
 def generate_wifi_qr(ssid, password, hidden=True):
     """
     Generate QR code for WiFi connection
     Format: WIFI:T:WPA;S:SSID;P:PASSWORD;H:true;;
+    Returns a segno QRCode; write it with .save(..., scale=WIFI_QR_SCALE)
     """
-    qr_data = f"WIFI:T:WPA;S:{ssid};P:{password};H:{'true' if hidden else 'false'};;"
-    
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    
-    return qr.make_image(fill_color="black", back_color="white")
+    return segno.make_qr(helpers.make_wifi_data(ssid, password, 'WPA', hidden), error='l')
 
 def generate_combined_qr(ssid, password, upload_url="http://192.168.4.1:5000/upload"):
     """
@@ -48,16 +44,7 @@ def generate_combined_qr(ssid, password, upload_url="http://192.168.4.1:5000/upl
     # Advanced apps can parse JSON, simple ones get basic info
     simple_data = f"Connect to: {ssid}\nPassword: {password}\nThen visit: {upload_url}"
     
-    qr = qrcode.QRCode(
-        version=2,  # Bigger version for more data
-        error_correction=qrcode.constants.ERROR_CORRECT_M,
-        box_size=8,
-        border=4,
-    )
-    qr.add_data(simple_data)
-    qr.make(fit=True)
-    
-    return qr.make_image(fill_color="black", back_color="white")
+    return segno.make_qr(simple_data, error='m')
 
 def save_qr_codes(ssid, password, output_dir="/home/pi/qr_codes/"):
     """Save QR codes as files"""
@@ -67,11 +54,11 @@ def save_qr_codes(ssid, password, output_dir="/home/pi/qr_codes/"):
     
     # WiFi-only QR
     wifi_qr = generate_wifi_qr(ssid, password)
-    wifi_qr.save(f"{output_dir}wifi_connection.png")
+    wifi_qr.save(f"{output_dir}wifi_connection.png", scale=WIFI_QR_SCALE, border=QR_BORDER)
     
     # Combined QR
     combined_qr = generate_combined_qr(ssid, password)
-    combined_qr.save(f"{output_dir}complete_instructions.png")
+    combined_qr.save(f"{output_dir}complete_instructions.png", scale=COMBINED_QR_SCALE, border=QR_BORDER)
     
     print(f"QR codes saved to {output_dir}")
     return output_dir
@@ -89,14 +76,14 @@ def log_user_activity(ip, action, filename=None):
     import datetime
     
     log_entry = {
-        'timestamp': datetime.datetime.now().isoformat(),
+        'timestamp': datetime.datetime.now(),
         'ip': ip,
         'action': action,
         'filename': filename
     }
     
-    with open('/var/log/image-hotspot/user_activity.log', 'a') as f:
-        f.write(json.dumps(log_entry) + '\n')
+    with open('/var/log/image-hotspot/user_activity.log', 'ab') as f:
+        f.write(orjson.dumps(log_entry, option=orjson.OPT_APPEND_NEWLINE))
 
 # Example Flask route modifications
 FLASK_INTEGRATION_EXAMPLE = '''
@@ -205,6 +205,26 @@ case "$1" in
 esac
 EOF
     chmod +x /usr/local/bin/manage-hotspot-users.sh
+
+    # Resident control daemon so the Flask app doesn't fork the script per request
+    install -m 755 "$(dirname "$0")/hotspot-ctl.py" /usr/local/bin/hotspot-ctl.py
+    cat > /etc/systemd/system/hotspot-ctl.service << EOF
+[Unit]
+Description=Image Sharing Hotspot control daemon
+After=network.target
+
+[Service]
+ExecStart=/usr/bin/python3 /usr/local/bin/hotspot-ctl.py
+# Only this group may connect to /run/hotspot-ctl.sock; match the Flask app's user
+Environment=HOTSPOT_CTL_GROUP=pi
+Restart=on-failure
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+    systemctl daemon-reload
+    systemctl enable hotspot-ctl
 }
 
 # Create QR code data
@@ -274,6 +294,7 @@ uninstall_hotspot() {
     systemctl disable hostapd
     systemctl disable dnsmasq
     systemctl disable image-hotspot
+    systemctl disable hotspot-ctl
     
     # Restore backups
     if [ -f "/etc/hostapd/hostapd.conf.backup" ]; then
@@ -291,6 +312,8 @@ uninstall_hotspot() {
     rm -f /etc/systemd/system/image-hotspot.service
     rm -f /usr/local/bin/start-image-hotspot.sh
     rm -f /usr/local/bin/manage-hotspot-users.sh
+    rm -f /etc/systemd/system/hotspot-ctl.service
+    rm -f /usr/local/bin/hotspot-ctl.py
     
     systemctl daemon-reload
     